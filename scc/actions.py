@@ -92,10 +92,13 @@ class Action(object):
 	MOD_SMOOTH		= 1 << 8
 	MOD_BALL		= 1 << 9
 	
+	# Delay before next action when used in Macro. Stored by Macro itself,
+	# this is only default used when Macro is created.
+	delay_after = DEFAULT_DELAY
+	
 	def __init__(self, *parameters):
 		self.parameters = parameters
 		self.name = None
-		self.delay_after = DEFAULT_DELAY
 		# internal, insignificant and never saved value used only by editor.
 		# Has to be set to iterable of callbacks to do something usefull;
 		# Callbacks in lilst are called with cb(app, action) after action is
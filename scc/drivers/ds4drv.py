@@ -22,6 +22,42 @@ log = logging.getLogger("DS4")
 VENDOR_ID = 0x054c
 PRODUCT_ID = 0x09cc
 
+# Button masks as plain ints, so no IntEnum arithmetic happens per event
+_CPADPRESS = int(SCButtons.CPADPRESS)
+_CPADTOUCH = int(SCButtons.CPADTOUCH)
+_NOT_CPADPRESS = ~_CPADPRESS & 0xFFFFFFFF
+_NOT_CPADTOUCH = ~_CPADTOUCH & 0xFFFFFFFF
+_decode = _lib.decode
+
+
+def _alloc_seq_id(daemon, prefix):
+	"""
+	Returns 'prefix' or 'prefix:X', whichever is not yet used by any
+	active controller. Active IDs are retrieved from daemon only once.
+	"""
+	active = set(daemon.get_active_ids())
+	magic_number = 1
+	id = prefix
+	while id in active:
+		id = "%s:%s" % (prefix, magic_number)
+		magic_number += 1
+	return id
+
+
+def _flatten_gyro_map(gyro_map):
+	"""
+	Converts GYRO_MAP into two lists indexed directly by event code,
+	so gyro events can be handled without dict lookup.
+	"""
+	if not HAVE_EVDEV:
+		# Without evdev, ECODES are just strings
+		return (), ()
+	size = max(gyro_map.keys()) + 1
+	axes, factors = [ None ] * size, [ 0 ] * size
+	for code, (axis, factor) in gyro_map.items():
+		axes[code], factors[code] = axis, factor
+	return tuple(axes), tuple(factors)
+
 
 class DS4Controller(HIDController):
 	# Most of axes are the same
@@ -49,6 +85,27 @@ class DS4Controller(HIDController):
 			| ControllerFlags.SEPARATE_STICK
 			| ControllerFlags.NO_GRIPS
 	)
+	_BUTTON_MAP_C = None
+	_TEST_BUTTON_MAP_C = None
+	
+	
+	@classmethod
+	def _compute_button_map(cls, test_mode):
+		"""
+		Returns ctypes array to be copied into decoder button_map.
+		Computed only once, as BUTTON_MAP never changes.
+		"""
+		if test_mode:
+			if cls._TEST_BUTTON_MAP_C is None:
+				cls._TEST_BUTTON_MAP_C = (ctypes.c_uint8 * BUTTON_COUNT)(
+						*xrange(BUTTON_COUNT))
+			return cls._TEST_BUTTON_MAP_C
+		if cls._BUTTON_MAP_C is None:
+			button_map = (ctypes.c_uint8 * BUTTON_COUNT)(*[ 64 ] * BUTTON_COUNT)
+			for x, sc in enumerate(cls.BUTTON_MAP):
+				button_map[x] = cls.button_to_bit(sc)
+			cls._BUTTON_MAP_C = button_map
+		return cls._BUTTON_MAP_C
 	
 	
 	def _load_hid_descriptor(self, config, max_size, vid, pid, test_mode):
@@ -114,27 +171,23 @@ class DS4Controller(HIDController):
 			button_count = 14
 		)
 		
-		if test_mode:
-			for x in xrange(BUTTON_COUNT):
-				self._decoder.buttons.button_map[x] = x
-		else:
-			for x in xrange(BUTTON_COUNT):
-				self._decoder.buttons.button_map[x] = 64
-			for x, sc in enumerate(DS4Controller.BUTTON_MAP):
-				self._decoder.buttons.button_map[x] = self.button_to_bit(sc)
+		ctypes.memmove(self._decoder.buttons.button_map,
+				DS4Controller._compute_button_map(test_mode), BUTTON_COUNT)
 		
 		self._packet_size = 64
+		# Reused for every packet, so it doesn't have to be allocated each time
+		self._decoder_ref = ctypes.byref(self._decoder)
 	
 	
 	def input(self, endpoint, data):
 		# Special override for CPAD touch button
-		if _lib.decode(ctypes.byref(self._decoder), data):
+		if _decode(self._decoder_ref, data):
 			if self.mapper:
 				if ord(data[35]) >> 7:
 					# cpad is not touched
-					self._decoder.state.buttons &= ~SCButtons.CPADTOUCH
+					self._decoder.state.buttons &= _NOT_CPADTOUCH
 				else:
-					self._decoder.state.buttons |= SCButtons.CPADTOUCH
+					self._decoder.state.buttons |= _CPADTOUCH
 				self.mapper.input(self,
 						self._decoder.old_state, self._decoder.state)
 
@@ -162,12 +215,7 @@ class DS4Controller(HIDController):
 		ID is generated as 'ds4' or 'ds4:X' where 'X' starts as 1 and increases
 		as controllers with same ids are connected.
 		"""
-		magic_number = 1
-		id = "ds4"
-		while id in self.daemon.get_active_ids():
-			id = "ds4:%s" % (magic_number, )
-			magic_number += 1
-		return id
+		return _alloc_seq_id(self.daemon, "ds4")
 
 
 class DS4EvdevController(EvdevController):
@@ -229,6 +277,7 @@ class DS4EvdevController(EvdevController):
 		EvdevController.ECODES.ABS_Y : (None, 1),		# 'q3'
 		EvdevController.ECODES.ABS_Z : (None, -1),		# 'q1'
 	}
+	GYRO_AXES, GYRO_FACTORS = _flatten_gyro_map(GYRO_MAP)
 	flags = ( ControllerFlags.EUREL_GYROS
 			| ControllerFlags.HAS_RSTICK
 			| ControllerFlags.HAS_CPAD
@@ -255,67 +304,97 @@ class DS4EvdevController(EvdevController):
 				device.grab()
 		EvdevController.__init__(self, daemon, controllerdevice, None, config)
 		if self.poller:
-			self.poller.register(touchpad.fd, self.poller.POLLIN, self._touchpad_input)
-			self.poller.register(gyro.fd, self.poller.POLLIN, self._gyro_input)
+			self.poller.register(touchpad.fd, self.poller.POLLIN, self._drain_inputs)
+			self.poller.register(gyro.fd, self.poller.POLLIN, self._drain_inputs)
 	
 	
-	def _gyro_input(self, *a):
-		new_state = self._state
-		try:
-			for event in self._gyro.read():
-				if event.type == self.ECODES.EV_ABS:
-					axis, factor = DS4EvdevController.GYRO_MAP[event.code]
-					if axis:
-						new_state = new_state._replace(
-								**{ axis : int(event.value * factor) })
-		except IOError:
-			# Errors here are not even reported, evdev class handles important ones
-			return
+	def _drain_inputs(self, *a):
+		"""
+		Called when gyro or touchpad device has data available.
+		Drains both devices and applies all changes at once, so mapper
+		is called only once even when both devices are readable.
+		"""
+		updates = {}
+		self._drain_gyro(updates)
+		buttons = self._drain_touchpad(updates, self._state.buttons)
+		if buttons != self._state.buttons:
+			updates['buttons'] = buttons
 		
-		if new_state is not self._state:
-			old_state, self._state = self._state, new_state
+		if updates:
+			old_state = self._state
+			new_state = self._state = old_state._replace(**updates)
 			if self.mapper:
 				self.mapper.input(self, old_state, new_state)
 	
 	
-	def _touchpad_input(self, *a):
-		new_state = self._state
+	def _drain_gyro(self, updates):
+		"""
+		Reads all events queued on gyro device, storing changed axes
+		into 'updates' dict.
+		"""
+		# Everything used in loop is looked up only once
+		axes, factors = DS4EvdevController.GYRO_AXES, DS4EvdevController.GYRO_FACTORS
+		axes_len = len(axes)
+		EV_ABS = self.ECODES.EV_ABS
 		try:
-			for event in self._touchpad.read():
-				if event.type == self.ECODES.EV_ABS:
-					if event.code == self.ECODES.ABS_MT_POSITION_X:
-						value = event.value * DS4EvdevController.TOUCH_FACTOR_X
-						value = STICK_PAD_MIN + int(value)
-						new_state = new_state._replace(cpad_x = value)
-					elif event.code == self.ECODES.ABS_MT_POSITION_Y:
-						value = event.value * DS4EvdevController.TOUCH_FACTOR_Y
-						value = STICK_PAD_MAX - int(value)
-						new_state = new_state._replace(cpad_y = value)
-				elif event.type == 0:
-					pass
-				elif event.code == self.ECODES.BTN_LEFT:
-					if event.value == 1:
-						b = new_state.buttons | SCButtons.CPADPRESS
-						new_state = new_state._replace(buttons = b)
-					else:
-						b = new_state.buttons & ~SCButtons.CPADPRESS
-						new_state = new_state._replace(buttons = b)
-				elif event.code == self.ECODES.BTN_TOUCH:
-					if event.value == 1:
-						b = new_state.buttons | SCButtons.CPADTOUCH
-						new_state = new_state._replace(buttons = b)
-					else:
-						b = new_state.buttons & ~SCButtons.CPADTOUCH
-						new_state = new_state._replace(buttons = b,
-								cpad_x = 0, cpad_y = 0)
+			while True:
+				events = list(self._gyro.read())
+				if not events:
+					break
+				for event in events:
+					if event.type == EV_ABS and event.code < axes_len:
+						axis = axes[event.code]
+						if axis:
+							updates[axis] = int(event.value * factors[event.code])
 		except IOError:
-			# Errors here are not even reported, evdev class handles important ones
-			return
-		
-		if new_state is not self._state:
-			old_state, self._state = self._state, new_state
-			if self.mapper:
-				self.mapper.input(self, old_state, new_state)
+			# Raised with EAGAIN once queue is drained. Other errors are
+			# not even reported, evdev class handles important ones
+			pass
+	
+	
+	def _drain_touchpad(self, updates, buttons):
+		"""
+		Same as _drain_gyro, but for touchpad device.
+		Returns new value of buttons.
+		"""
+		# Everything used in loop is looked up only once
+		EV_ABS = self.ECODES.EV_ABS
+		ABS_MT_X = self.ECODES.ABS_MT_POSITION_X
+		ABS_MT_Y = self.ECODES.ABS_MT_POSITION_Y
+		BTN_LEFT = self.ECODES.BTN_LEFT
+		BTN_TOUCH = self.ECODES.BTN_TOUCH
+		TFX = DS4EvdevController.TOUCH_FACTOR_X
+		TFY = DS4EvdevController.TOUCH_FACTOR_Y
+		CPADPRESS, NCPADPRESS = _CPADPRESS, _NOT_CPADPRESS
+		CPADTOUCH, NCPADTOUCH = _CPADTOUCH, _NOT_CPADTOUCH
+		try:
+			while True:
+				events = list(self._touchpad.read())
+				if not events:
+					break
+				for event in events:
+					if event.type == EV_ABS:
+						if event.code == ABS_MT_X:
+							updates['cpad_x'] = STICK_PAD_MIN + int(event.value * TFX)
+						elif event.code == ABS_MT_Y:
+							updates['cpad_y'] = STICK_PAD_MAX - int(event.value * TFY)
+					elif event.type == 0:
+						pass
+					elif event.code == BTN_LEFT:
+						if event.value == 1:
+							buttons |= CPADPRESS
+						else:
+							buttons &= NCPADPRESS
+					elif event.code == BTN_TOUCH:
+						if event.value == 1:
+							buttons |= CPADTOUCH
+						else:
+							buttons &= NCPADTOUCH
+							updates['cpad_x'] = updates['cpad_y'] = 0
+		except IOError:
+			# Same as above
+			pass
+		return buttons
 	
 	
 	def close(self):
@@ -350,12 +429,7 @@ class DS4EvdevController(EvdevController):
 		ID is generated as 'ds4' or 'ds4:X' where 'X' starts as 1 and increases
 		as controllers with same ids are connected.
 		"""
-		magic_number = 1
-		id = "ds4"
-		while id in self.daemon.get_active_ids():
-			id = "ds4:%s" % (magic_number, )
-			magic_number += 1
-		return id
+		return _alloc_seq_id(self.daemon, "ds4")
 
 
 def init(daemon, config):
@@ -367,35 +441,38 @@ def init(daemon, config):
 	def make_evdev_device(syspath, *whatever):
 		devices = get_evdev_devices_from_syspath(syspath)
 		# With kernel 4.10 or later, PS4 controller pretends to be 3 different devices.
-		# 1st, determining which one is actual controller is needed
+		# 1st, sort them by number of axes, reading capabilities only once
 		controllerdevice = None
+		gyros, touchpads = [], []
 		for device in devices:
-			count = len(get_axes(device))
+			axes = get_axes(device)
+			count = len(axes)
 			if count == 8:
 				# 8 axes - Controller
 				controllerdevice = device
+			elif count == 6:
+				# 6 axes
+				if EvdevController.ECODES.ABS_MT_POSITION_X in axes:
+					# kernel 4.17+ - touchpad
+					touchpads.append(device)
+				else:
+					# gyro sensor
+					gyros.append(device)
+			elif count == 4:
+				# 4 axes - Touchpad
+				touchpads.append(device)
 		if not controllerdevice:
 			log.warning("Failed to determine controller device")
 			return None
-		# 2nd, find motion sensor and touchpad with physical address matching controllerdevice
+		# 2nd, pick motion sensor and touchpad with physical address matching controllerdevice
 		gyro, touchpad = None, None
-		phys = device.phys.split("/")[0]
-		for device in devices:
+		phys = controllerdevice.phys.split("/")[0]
+		for device in gyros:
+			if device.phys.startswith(phys):
+				gyro = device
+		for device in touchpads:
 			if device.phys.startswith(phys):
-				axes = get_axes(device)
-				count = len(axes)
-				if count == 6:
-					# 6 axes
-					if EvdevController.ECODES.ABS_MT_POSITION_X in axes:
-						# kernel 4.17+ - touchpad
-						touchpad = device
-					else:
-						# gyro sensor
-						gyro = device
-					pass
-				elif count == 4:
-					# 4 axes - Touchpad
-					touchpad = device
+				touchpad = device
 		# 3rd, do a magic
 		if controllerdevice and gyro and touchpad:
 			return make_new_device(DS4EvdevController, controllerdevice, gyro, touchpad)
@@ -2,6 +2,7 @@ from __future__ import unicode_literals
 from scc.parser import ActionParser, ParseError
 from scc.actions import Action
 from scc.tools import _
+from collections import OrderedDict
 
 import logging
 log = logging.getLogger("gui.parse")
@@ -32,6 +33,13 @@ class GuiActionParser(ActionParser):
 	ActionParser that stores original string and
 	returns InvalidAction instance when parsing fails
 	"""
+	# Number of recently failed strings remembered by parse()
+	FAILED_CACHE_SIZE = 32
+	
+	def __init__(self, string=""):
+		self._failed = OrderedDict()
+		ActionParser.__init__(self, string)
+	
 	
 	def restart(self, string):
 		self.string = string
@@ -40,8 +48,14 @@ class GuiActionParser(ActionParser):
 	
 	def parse(self):
 		"""
-		Returns parsed action or None if action cannot be parsed.
+		Returns parsed action or InvalidAction if action cannot be parsed.
+		
+		Errors for recently failed strings are remembered, so parsing same
+		invalid string again, which happens a lot while user is typing into
+		editor, doesn't have to go through parser and exception again.
 		"""
+		if self.string in self._failed:
+			return InvalidAction(self.string, self._failed[self.string])
 		try:
 			a = ActionParser.parse(self)
 			a.string = self.string
@@ -49,4 +63,7 @@ class GuiActionParser(ActionParser):
 		except ParseError, e:
 			log.error("Failed to parse '%s'", self.string)
 			log.error(e)
+			self._failed[self.string] = e
+			if len(self._failed) > self.FAILED_CACHE_SIZE:
+				self._failed.popitem(last=False)
 			return InvalidAction(self.string, e)
@@ -12,11 +12,31 @@ from scc.constants import LEFT, RIGHT, STICK, SCButtons
 from scc.uinput import Keys
 
 
-import time, logging
+import time, string, logging
 log = logging.getLogger("Macros")
 _ = lambda x : x
 
 
+def _build_type_table():
+	"""
+	Builds table used by Type action, mapping each allowed character
+	to (needs_shift, keycode) tuple.
+	needs_shift is None for characters that don't care about shift state.
+	"""
+	table = { ' ' : (None, Keys.KEY_SPACE) }
+	for letter in string.ascii_lowercase + string.digits:
+		key = getattr(Keys, "KEY_" + letter.upper(), None)
+		if key is not None:
+			table[letter] = (False, key)
+	for letter in string.ascii_uppercase:
+		key = getattr(Keys, "KEY_" + letter, None)
+		if key is not None:
+			table[letter] = (True, key)
+	return table
+
+_TYPE_TABLE = _build_type_table()
+
+
 class Macro(Action):
 	"""
 	Two or more actions executed in sequence.
@@ -25,24 +45,47 @@ class Macro(Action):
 
 	COMMAND = None
 	HOLD_TIME = 0.01
+	# Filled by _cache_capable_actions
+	_haptic_actions = None
+	_speed_actions = None
 	
 	def __init__(self, *parameters):
 		Action.__init__(self, *parameters)
 		self.actions = []
+		self._delays = []			# Delay after each action, in same order
 		self.repeat = False
 		self.hold_time = Macro.HOLD_TIME
 		self._active = False
-		self._current = None
+		self._idx = None			# Index of next action, None while idle
 		self._release = None
+		# Nested macro is already flattened when it's passed in, so its
+		# actions are copied as they are, without expanding them again.
+		# Delays are kept separately, so same action can be used in multiple
+		# macros with different delays.
+		append, extend = self.actions.append, self.actions.extend
 		for p in parameters:
-			if type(p) == float and len(self.actions):
-				self.actions[-1].delay_after = p
+			if type(p) == float and self.actions:
+				self._delays[-1] = p
 			elif isinstance(p, Macro):
-				self.actions += p.actions
-			elif isinstance(p, Action):
-				self.actions.append(p)
+				extend(p.actions)
+				self._delays.extend(p._delays)
 			else:
-				self.actions.append(ButtonAction(p))
+				if not isinstance(p, Action):
+					p = ButtonAction(p)
+				append(p)
+				self._delays.append(p.delay_after)
+	
+	
+	def _cache_capable_actions(self):
+		"""
+		Stores lists of child actions that support haptic and speed settings.
+		Called only on first use, as parser creates and throws away a lot of
+		intermediate Macros that never need them.
+		"""
+		self._haptic_actions = [ a for a in self.actions
+				if a and hasattr(a, "set_haptic") ]
+		self._speed_actions = [ a for a in self.actions
+				if hasattr(a, "set_speed") ]
 	
 	
 	def button_press(self, mapper):
@@ -51,34 +94,36 @@ class Macro(Action):
 			# Empty macro
 			return False
 		self._active = True
-		if self._current is not None:
+		if self._idx is not None:
 			# Already executing macro
 			return False
-		self._current = [] + self.actions
+		self._idx = 0
 		self.timer(mapper)
 	
 	
 	def timer(self, mapper):
 		if self._release is None:
 			# Execute next action
-			self._release, self._current = self._current[0], self._current[1:]
+			self._release = self.actions[self._idx]
+			self._idx += 1
 			self._release.button_press(mapper)
 			mapper.schedule(self.hold_time, self.timer)
 		else:
 			# Finish execited action
 			self._release.button_release(mapper)
-			if len(self._current) == 0 and self.repeat and self._active:
+			delay = self._delays[self._idx - 1]
+			if self._idx >= len(self.actions) and self.repeat and self._active:
 				# Repeating
-				self._current = [] + self.actions
-				mapper.schedule(self._release.delay_after, self.timer)
+				self._idx = 0
+				mapper.schedule(delay, self.timer)
 				self._release = None
-			elif len(self._current) == 0:
+			elif self._idx >= len(self.actions):
 				# Finished
-				self._current = None
+				self._idx = None
 				self._release = None
 			else:
 				# Schedule for next action
-				mapper.schedule(self._release.delay_after, self.timer)
+				mapper.schedule(delay, self.timer)
 				self._release = None
 	
 	
@@ -88,28 +133,36 @@ class Macro(Action):
 	
 	
 	def set_haptic(self, hapticdata):
-		for a in self.actions:
-			if a and hasattr(a, "set_haptic"):
-				a.set_haptic(hapticdata)
+		if self._haptic_actions is None:
+			self._cache_capable_actions()
+		if not self._haptic_actions:
+			return
+		for a in self._haptic_actions:
+			a.set_haptic(hapticdata)
 	
 	
 	def get_haptic(self):
-		for a in self.actions:
-			if a and hasattr(a, "set_haptic"):
-				return a.get_haptic()
+		if self._haptic_actions is None:
+			self._cache_capable_actions()
+		if self._haptic_actions:
+			return self._haptic_actions[0].get_haptic()
 		return None
 	
 	
 	def set_speed(self, x, y, z):
-		for a in self.actions:
-			if hasattr(a, "set_speed"):
-				a.set_speed(x, y, z)
+		if self._speed_actions is None:
+			self._cache_capable_actions()
+		if not self._speed_actions:
+			return
+		for a in self._speed_actions:
+			a.set_speed(x, y, z)
 	
 	
 	def get_speed(self):
-		for a in self.actions:
-			if hasattr(a, "set_speed"):
-				return a.get_speed()
+		if self._speed_actions is None:
+			self._cache_capable_actions()
+		if self._speed_actions:
+			return self._speed_actions[0].get_speed()
 		return (1.0,)
 	
 	
@@ -120,12 +173,12 @@ class Macro(Action):
 	def describe(self, context):
 		if self.name: return self.name
 		if self.repeat:
-			return "repeat " + "; ".join([ x.describe(context) for x in self.actions ])
-		return "; ".join([ x.describe(context) for x in self.actions ])
+			return "repeat " + "; ".join(x.describe(context) for x in self.actions)
+		return "; ".join(x.describe(context) for x in self.actions)
 	
 	
 	def to_string(self, multiline=False, pad=0):
-		lst = "; ".join([ x.to_string() for x in self.actions ])
+		lst = "; ".join(x.to_string() for x in self.actions)
 		if self.repeat:
 			return (" " * pad) + ("repeat(%s)" % (lst,))
 		return (" " * pad) + lst
@@ -133,8 +186,8 @@ class Macro(Action):
 	
 	def __str__(self):
 		if self.repeat:
-			return "<[repeat %s ]>" % ("; ".join([ str(x) for x in self.actions ]), )
-		return "<[ %s ]>" % ("; ".join([ str(x) for x in self.actions ]), )
+			return "<[repeat %s ]>" % ("; ".join(str(x) for x in self.actions), )
+		return "<[ %s ]>" % ("; ".join(str(x) for x in self.actions), )
 	
 	__repr__ = __str__
 
@@ -155,25 +208,23 @@ class Type(Macro):
 		params = []
 		shift = False
 		for letter in string:
-			if (letter >= 'a' and letter <= 'z') or (letter >= '0' and letter <= '9'):
-				if hasattr(Keys, ("KEY_" + letter).upper()):
-					if shift:
-						params.append(ReleaseAction(Keys.KEY_LEFTSHIFT))
-						shift = False
-					params.append(ButtonAction(getattr(Keys, ("KEY_" + letter).upper())))
-					continue
-			if letter == ' ':
-				params.append(ButtonAction(Keys.KEY_SPACE))
-				continue
-			if letter >= 'A' and letter <= 'Z':
-				if hasattr(Keys, "KEY_" + letter):
-					if not shift:
-						params.append(PressAction(Keys.KEY_LEFTSHIFT))
-						shift = True
-					params.append(ButtonAction(getattr(Keys, "KEY_" + letter)))
-					continue
-			raise ValueError("Invalid character for type(): '%s'" % (letter,))
+			entry = _TYPE_TABLE.get(letter)
+			if entry is None:
+				raise ValueError("Invalid character for type(): '%s'" % (letter,))
+			needs_shift, key = entry
+			if needs_shift is not None and needs_shift != shift:
+				if needs_shift:
+					params.append(PressAction(Keys.KEY_LEFTSHIFT))
+				else:
+					params.append(ReleaseAction(Keys.KEY_LEFTSHIFT))
+				shift = needs_shift
+			params.append(ButtonAction(key))
+		if shift:
+			# Don't leave shift pressed after last uppercase letter
+			params.append(ReleaseAction(Keys.KEY_LEFTSHIFT))
 		Macro.__init__(self, *params)
+		# Sequence is fully determined by string and never changes
+		self.actions = tuple(self.actions)
 		self.letters = string
 	
 	
@@ -193,20 +244,20 @@ class Cycle(Macro):
 	def __init__(self, *parameters):
 		Action.__init__(self, *parameters)
 		self.actions = parameters
+		self._delays = [ a.delay_after for a in parameters ]
+		self._n = len(parameters)
 		self._current = 0
 	
 	
 	def button_press(self, mapper):
-		if len(self.actions) > 0:
+		if self._n:
 			self.actions[self._current].button_press(mapper)
 	
 	
 	def button_release(self, mapper):
-		if len(self.actions) > 0:
+		if self._n:
 			self.actions[self._current].button_release(mapper)
-			self._current += 1
-			if self._current >= len(self.actions):
-				self._current = 0
+			self._current = (self._current + 1) % self._n
 	
 	
 	def describe(self, context):
@@ -215,12 +266,12 @@ class Cycle(Macro):
 	
 	
 	def to_string(self, multiline=False, pad=0):
-		lst = ", ".join([ x.to_string() for x in self.actions ])
+		lst = ", ".join(x.to_string() for x in self.actions)
 		return (" " * pad) + self.COMMAND + "(" + lst + ")"
 	
 	
 	def __str__(self):
-		return "<cycle %s >" % ("; ".join([ str(x) for x in self.actions ]), )
+		return "<cycle %s >" % ("; ".join(str(x) for x in self.actions), )
 	
 	__repr__ = __str__
 
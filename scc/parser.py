@@ -260,12 +260,15 @@ class ActionParser(object):
 			raise ParseError("Invalid number of parameters for '%s'" % (cls.COMMAND))
 	
 	
-	def _parse_action(self, frm=Action.ALL):
+	def _parse_action(self, frm=Action.ALL, in_macro=False):
 		"""
 		Parses one action, that is one of:
 		 - something(params)
 		 - something()
 		 - something
+		
+		If 'in_macro' is True, action is part of ';' chain collected by
+		caller and ';' after it is left for caller to handle.
 		"""
 		# Check if next token is TokenType.NAME and grab action name from it
 		t = self._next_token()
@@ -289,7 +292,7 @@ class ActionParser(object):
 			# ACTION dict can have nested dicts; SOMETHING.action
 			if type(action_class) == dict:
 				self._next_token()
-				return self._parse_action(action_class)
+				return self._parse_action(action_class, in_macro)
 			else:
 				raise ParseError("Unexpected '.' after '%s'" % (action_name,))
 		if t.type == TokenType.OP and t.value == '(':
@@ -323,16 +326,26 @@ class ActionParser(object):
 			return MultiAction(action1, action2)
 		
 		if t.type == TokenType.OP and t.value == ';':
-			# Two (or more) actions joined by ';'
-			self._next_token()
-			while self._tokens_left() and self._peek_token().type == TokenType.NEWLINE:
-				self._next_token()
-			if not self._tokens_left():
-				# Having ';' at end of string is not actually error
+			if in_macro:
+				# Rest of chain is handled by caller
 				return self._create_action(action_class, *parameters)
-			action1 = self._create_action(action_class, *parameters)
-			action2 = self._parse_action()
-			return Macro(action1, action2)
+			# Two (or more) actions joined by ';'. Whole chain is collected
+			# first, so only one Macro is created for it
+			actions = [ self._create_action(action_class, *parameters) ]
+			while self._tokens_left():
+				t = self._peek_token()
+				if t.type != TokenType.OP or t.value != ';':
+					break
+				self._next_token()
+				while self._tokens_left() and self._peek_token().type == TokenType.NEWLINE:
+					self._next_token()
+				if not self._tokens_left():
+					# Having ';' at end of string is not actually error
+					break
+				actions.append(self._parse_action(in_macro=True))
+			if len(actions) == 1:
+				return actions[0]
+			return Macro(*actions)
 		
 		return self._create_action(action_class, *parameters)
 	
@@ -35,6 +35,7 @@ class TestMacros(object):
 		same action.
 		"""
 		assert _parses_as_itself(Type("ilovecandy"))
+		assert _parses_as_itself(Type("I love Candy 42"))
 	
 	
 	def test_cycle(self):